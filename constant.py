@@ -7,36 +7,72 @@ from parser import *
 import math
 
 
+_HEX_RE = re.compile(r'[0-9a-fA-F]+')
+_OCT_RE = re.compile(r'[0-7]+')
+_DEC_RE = re.compile(r'[0-9]+')
+_OCT_ESC_RE = re.compile(r'[0-7]{1,3}')
+_STR_CHUNK_RE = re.compile(r'[^"\\]*')  # run of characters needing no escape
+
+# simple escape sequences, indexed by the code of the character after the backslash
+_ESC_TABLE = [None] * 128
+for _esc, _char in zip('\\?\'"abfnrtv', '\\?\'"\a\b\f\n\r\t\v'):
+    _ESC_TABLE[ord(_esc)] = _char
+del _esc, _char
+_CHAR_ESC_TABLE = [None if char is None else char.encode('ascii') for char in _ESC_TABLE]
+
+
 class Fraction:
     """
     Actually I use this to handle `int`
     """
+    __slots__ = ('numerator', 'denominator')
+
     def __init__(self, numerator: int, denominator: int=1):
         if denominator == 0:
             raise ZeroDivisionError()
         if denominator < 0:
             numerator *= -1
             denominator *= -1
+        if denominator == 1 or numerator == 0:  # already reduced
+            self.numerator = numerator
+            self.denominator = 1
+            return
         gcd = math.gcd(numerator, denominator)
         self.numerator = numerator // gcd
         self.denominator = denominator // gcd
 
+    @staticmethod
+    def _raw(numerator: int, denominator: int):
+        """
+        Build a fraction which is known to be reduced with positive denominator
+        """
+        fraction = Fraction.__new__(Fraction)
+        fraction.numerator = numerator
+        fraction.denominator = denominator
+        return fraction
+
     @staticmethod
     def from_int(integer: int):
-        return Fraction(integer, 1)
+        fraction = _SMALL_FRACTIONS.get(integer)
+        if fraction is None:
+            fraction = Fraction._raw(integer, 1)
+        return fraction
 
     def __eq__(self, other) -> bool:
         if isinstance(other, int):
             other = Fraction.from_int(other)
         elif not isinstance(other, Fraction):
-            raise TypeError("Cannot compare type Fraction with type {}".format(type(other)))
-        return other.denominator * self.numerator == other.numerator * self.denominator
+            return NotImplemented
+        # both are reduced, so equal fractions have equal terms
+        return self.numerator == other.numerator and self.denominator == other.denominator
 
     def __lt__(self, other):
         if isinstance(other, int):
             other = Fraction.from_int(other)
         elif not isinstance(other, Fraction):
             raise TypeError("Cannot compare type Fraction with type {}".format(type(other)))
+        if self.denominator == other.denominator:  # including both integers
+            return self.numerator < other.numerator
         return other.denominator * self.numerator < other.numerator * self.denominator
 
     def __le__(self, other):
@@ -44,6 +80,8 @@ class Fraction:
             other = Fraction.from_int(other)
         elif not isinstance(other, Fraction):
             raise TypeError("Cannot compare type Fraction with type {}".format(type(other)))
+        if self.denominator == other.denominator:  # including both integers
+            return self.numerator <= other.numerator
         return other.denominator * self.numerator <= other.numerator * self.denominator
 
     def __add__(self, other):
@@ -53,8 +91,12 @@ class Fraction:
             raise TypeError("Cannot add type {} to type Fraction".format(type(other)))
         gcd = math.gcd(self.denominator, other.denominator)
         numerator = self.denominator // gcd * other.numerator + other.denominator // gcd * self.numerator
-        denominator = self.denominator * other.denominator // gcd
-        return Fraction(numerator, denominator)
+        if numerator == 0:
+            return Fraction.from_int(0)
+        # any common factor of the result also divides gcd (Knuth 4.5.1)
+        gcd2 = math.gcd(numerator, gcd)
+        denominator = self.denominator // gcd * (other.denominator // gcd2)
+        return Fraction._raw(numerator // gcd2, denominator)
 
     def __sub__(self, other):
         if isinstance(other, int):
@@ -63,26 +105,45 @@ class Fraction:
             raise TypeError("Cannot sub {} from type Fraction".format(type(other)))
         gcd = math.gcd(self.denominator, other.denominator)
         numerator = other.denominator // gcd * self.numerator - self.denominator // gcd * other.numerator
-        denominator = self.denominator * other.denominator // gcd
-        return Fraction(numerator, denominator)
+        if numerator == 0:
+            return Fraction.from_int(0)
+        # any common factor of the result also divides gcd (Knuth 4.5.1)
+        gcd2 = math.gcd(numerator, gcd)
+        denominator = self.denominator // gcd * (other.denominator // gcd2)
+        return Fraction._raw(numerator // gcd2, denominator)
 
     def __mul__(self, other):
         if isinstance(other, int):
             other = Fraction.from_int(other)
         elif not isinstance(other, Fraction):
             raise TypeError("Cannot mul type Fraction with type {}".format(type(other)))
-        numerator = other.numerator * self.numerator
-        denominator = self.denominator * other.denominator
-        return Fraction(numerator, denominator)
+        # both are reduced, so only cross gcd can be shared
+        gcd1 = math.gcd(self.numerator, other.denominator)
+        gcd2 = math.gcd(other.numerator, self.denominator)
+        numerator = (self.numerator // gcd1) * (other.numerator // gcd2)
+        denominator = (self.denominator // gcd2) * (other.denominator // gcd1)
+        return Fraction._raw(numerator, denominator)
 
     def __truediv__(self, other):
         if isinstance(other, int):
             other = Fraction.from_int(other)
         elif not isinstance(other, Fraction):
             raise TypeError("Cannot div type Fraction by type {}".format(type(other)))
-        numerator = other.denominator * self.numerator
-        denominator = self.denominator * other.numerator
-        return Fraction(numerator, denominator)
+        if other.numerator == 0:
+            raise ZeroDivisionError()
+        gcd1 = math.gcd(self.numerator, other.numerator)
+        gcd2 = math.gcd(other.denominator, self.denominator)
+        numerator = (self.numerator // gcd1) * (other.denominator // gcd2)
+        denominator = (self.denominator // gcd2) * (other.numerator // gcd1)
+        if denominator < 0:
+            numerator *= -1
+            denominator *= -1
+        return Fraction._raw(numerator, denominator)
+
+    def __hash__(self):
+        if self.denominator == 1:  # equal to the int
+            return hash(self.numerator)
+        return hash((self.numerator, self.denominator))
 
     def __repr__(self):
         return "Fraction(%d, %d)" % (self.numerator, self.denominator)
@@ -96,24 +157,34 @@ class Fraction:
         return self.numerator / self.denominator
 
 
-IDENTIFIER_PATTERN = re.compile(r"^([a-zA-z_]([a-zA-z_0-9]*))")
+# shared instances of small integers, like the small int cache of CPython
+_SMALL_FRACTIONS = {i: Fraction._raw(i, 1) for i in range(-128, 257)}
+
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
 
 
 class Identifier:
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
     def __eq__(self, other):
+        if not isinstance(other, Identifier):
+            return NotImplemented
         return self.name == other.name
 
+    def __hash__(self):
+        return hash(self.name)
+
     @staticmethod
     def parse_identifier(state):
         pos, string = state
-        result = IDENTIFIER_PATTERN.match(string)
+        result = IDENTIFIER_PATTERN.match(string, pos)
         if result is None:
             raise TokenError("Invalid identifier name", pos)
-        name = result.group(0)  # matched part
-        return Identifier(name), (pos+len(name), string[result.end():])
+        return Identifier(result.group(0)), (result.end(), string)
 
 
 class Keywords(enum.Enum):
@@ -154,15 +225,25 @@ class Keywords(enum.Enum):
     @staticmethod
     def parse_keyword(state: (int, str)):
         pos, string = state
-        rest = string[pos:]
-        for one in Keywords:
-            name = one.name.lower()
-            if rest.startswith(name):  # matched
-                return one, (pos + len(name), string)
+        bucket = _KW_BY_FIRST.get(string[pos:pos+1])
+        if bucket is not None:
+            for name, one in bucket:
+                if string.startswith(name, pos):  # matched
+                    return one, (pos + len(name), string)
         raise TokenError("Expected keyword here", pos)
 
 
+_KW_LOWER = [(one.name.lower(), one) for one in Keywords]
+# first character -> [(keyword, member)], longest first so the longest keyword wins
+_KW_BY_FIRST = {}
+for _name, _one in sorted(_KW_LOWER, key=lambda kw: -len(kw[0])):
+    _KW_BY_FIRST.setdefault(_name[0], []).append((_name, _one))
+del _name, _one
+
+
 class Constant:
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
@@ -178,9 +259,17 @@ class Constant:
 
 
 class IntegerConstant(Constant):
+    __slots__ = ()
 
     def __init__(self, value):
-        super().__init__(Fraction(value))
+        super().__init__(Fraction.from_int(value))
+
+    @staticmethod
+    def from_int(value: int):
+        constant = _SMALL_INTEGERS.get(value)
+        if constant is None:
+            constant = IntegerConstant(value)
+        return constant
 
     @staticmethod
     def parse(state: (int, str)):
@@ -189,49 +278,43 @@ class IntegerConstant(Constant):
         if rest.startswith('0x'):  # hex number
             pos += 2
             rest = rest[2:]
-            result = re.match('^([0-9a-fA-F]+)', rest)
+            result = _HEX_RE.match(rest)
             if result is None:
                 raise TokenError("Expect hex literal here", pos)
             literal = result.group(0)
-            return IntegerConstant(int(literal, 0x10)), (pos+len(literal), string)
+            return IntegerConstant.from_int(int(literal, 0x10)), (pos+len(literal), string)
         elif rest.startswith('0'):  # octal number
             pos += 1
             rest = rest[1:]
-            result = re.match('^([0-7]+)', rest)
+            result = _OCT_RE.match(rest)
             if result is None:
                 raise TokenError("Expect octal literal here", pos)
             literal = result.group(0)
-            return IntegerConstant(int(literal, 0o10)), (pos + len(literal), string)
+            return IntegerConstant.from_int(int(literal, 0o10)), (pos + len(literal), string)
         else:  # decimal
             # result = re.match('^([1-9][0-9]*)', string)
             # they should be the same
-            result = re.match('^([0-9]+)', string)
+            result = _DEC_RE.match(rest)
             if result is None:
                 raise TokenError("Expect decimal literal here", pos)
             literal = result.group(0)
-            return IntegerConstant(int(literal, 10)), (pos + len(literal), string)
+            return IntegerConstant.from_int(int(literal, 10)), (pos + len(literal), string)
+
+
+_SMALL_INTEGERS = {i: IntegerConstant(i) for i in range(-128, 257)}
 
 
 class CharConstant(Constant):
+    __slots__ = ()
+
     @staticmethod
     def parse(state: (int, str)):
         _, state = parse_char("'")(state)
         pos, string = state
         if string[pos] == '\\':  # transferred character
             pos += 1  # backslash
-            char = {
-                '\\': b'\\',
-                '?': b'?',
-                '\'': b'\'',
-                '"': b'"',
-                'a': b'\a',
-                'b': b'\b',
-                'f': b'\f',
-                'n': b'\n',
-                'r': b'\r',
-                't': b'\t',
-                'v': b'\v',
-            }.get(string[pos], None)
+            code = ord(string[pos])
+            char = _CHAR_ESC_TABLE[code] if code < 128 else None
             if char is not None:  # exactly one character
                 pos += 1
             else:  # hex or octal
@@ -240,7 +323,7 @@ class CharConstant(Constant):
                     char = bytes.fromhex(string[pos:pos+2])
                     pos += 2  # hh
                 else:  # octal number
-                    result = re.match('^([0-7]{1,3})', string[pos:pos+3])
+                    result = _OCT_ESC_RE.match(string, pos)
                     if result is None:
                         raise TokenError("Expect octal literal", pos)
                     literal = result.group(0)
@@ -256,51 +339,42 @@ class CharConstant(Constant):
 
 
 class StringConstant(Constant):
+    __slots__ = ()
+
     @staticmethod
     def parse(state: (int, str)):
         _, state = parse_char('"')(state)
         pos, string = state
-        target = ""
+        n = len(string)
+        target = []
         # I'm missing pointer here.
-        while pos < len(string):
-            ch = string[pos]
-            # end flag
-            if ch == '"':
+        while True:
+            end = _STR_CHUNK_RE.match(string, pos).end()
+            target.append(string[pos:end])
+            pos = end
+            # end flag (or EOF, which parse_char reports)
+            if pos >= n or string[pos] == '"':
                 break
 
-            if ch == '\\':  # transfer
-                pos += 1  # backslash
-                char = {
-                    '\\': '\\',
-                    '?': '?',
-                    '\'': '\'',
-                    '"': '"',
-                    'a': '\a',
-                    'b': '\b',
-                    'f': '\f',
-                    'n': '\n',
-                    'r': '\r',
-                    't': '\t',
-                    'v': '\v',
-                }.get(string[pos], None)
-                if char is not None:  # exactly one character
-                    pos += 1
-                else:  # hex or octal
-                    if string[pos] == 'x':  # hex number
-                        pos += 1  # x
-                        target += chr(int(string[pos:pos+2], 16))
-                        pos += 2  # hh
-                    else:  # octal number
-                        result = re.match('^([0-7]{1,3})', string[pos:pos+3])
-                        if result is None:
-                            raise TokenError("Expect octal literal", pos)
-                        literal = result.group(0)
-                        value = int(literal, 0o10)
-                        target += chr(value)
-                        pos += len(literal)
-            else:  # normal character
-                target += ch
-                pos += 1  # move to next character
+            pos += 1  # backslash
+            code = ord(string[pos]) if pos < n else 0
+            char = _ESC_TABLE[code] if code < 128 else None
+            if char is not None:  # exactly one character
+                target.append(char)
+                pos += 1
+            elif string.startswith('x', pos):  # hex number
+                pos += 1  # x
+                result = _HEX_RE.match(string, pos, pos + 2)
+                if result is None:
+                    raise TokenError("Expect hex literal", pos)
+                target.append(chr(int(result.group(0), 0x10)))
+                pos = result.end()  # hh
+            else:  # octal number
+                result = _OCT_ESC_RE.match(string, pos)
+                if result is None:
+                    raise TokenError("Expect octal literal", pos)
+                target.append(chr(int(result.group(0), 0o10)))
+                pos = result.end()
 
         _, state = parse_char('"')((pos, string))
-        return StringConstant(target), state
+        return StringConstant(''.join(target)), state
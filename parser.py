@@ -1,8 +1,12 @@
 """
 monad style parser
 """
+import re
 from functools import wraps
 
+_SPACE_SET = frozenset(' \t\n\r')
+_SPACE_RE = re.compile(r'[ \t\n\r]*')
+
 
 class TokenError(Exception):
     def __init__(self, desc, pos):
@@ -24,7 +28,7 @@ class TokenError(Exception):
 
 def parse_item(state: (int, str)):
     pos, string = state
-    if string[pos:] == '':
+    if pos >= len(string):
         raise TokenError("Unexpected EOF", pos)
     return string[pos], (pos+1, string)
 
@@ -32,39 +36,57 @@ def parse_item(state: (int, str)):
 def parse_sat(predict):
     @wraps(predict)
     def parser(state):
-        item, state = parse_item(state)
+        pos, string = state
+        if pos >= len(string):
+            raise TokenError("Unexpected EOF", pos)
+        item = string[pos]
         if predict(item):
-            return item, state
-        raise TokenError.from_state('Unexpected character `%s`' % item, state)
+            return item, (pos+1, string)
+        raise TokenError('Unexpected character `%s`' % item, pos+1)
     return parser
 
 
 def parse_char(char):
-    return parse_sat(lambda x: char == x)
+    def parser(state):
+        pos, string = state
+        if string.startswith(char, pos):
+            return char, (pos+1, string)
+        if pos >= len(string):
+            raise TokenError("Unexpected EOF", pos)
+        raise TokenError('Unexpected character `%s`' % string[pos], pos+1)
+    parser.__name__ = "parse <{}>".format(char)
+    return parser
 
 
 def parse_string(string):
+    parse_chars = [parse_char(char) for char in string]
+
     def parser(state: (int, str)):
-        result = ''
-        for char in string:
-            char, state = parse_char(char)
-            result += char
-        return result, state
+        for parse_one in parse_chars:
+            _, state = parse_one(state)
+        return string, state
     parser.__name__ = "parse <{}>".format(string)
     return parser
 
 
-def parse_many(parse_func):
-    parse_one = parse_many1(parse_func)
+def _try_parse(parse_func, state):
+    """
+    :return: `(item, state)` or None if `parse_func` fails
+    """
+    try:
+        return parse_func(state)
+    except TokenError:
+        return None
 
+
+def parse_many(parse_func):
     @wraps(parse_func)
     def parser(state: (int, str)):
-        try:
-            many, state = parse_one(state)
-        except TokenError:
-            return [], state
-        else:
-            return many, state
+        results = []
+        while (result := _try_parse(parse_func, state)) is not None:
+            item, state = result
+            results.append(item)
+        return results, state
     return parser
 
 
@@ -75,23 +97,30 @@ def parse_many1(parse_func):
     def parser(state: (int, str)):
         one, state = parse_func(state)
         many, state = parse_any(state)
-        return [one] + many, state
+        many.insert(0, one)
+        return many, state
     return parser
 
 
 def is_space(char):
-    return char in {' ', '\t', '\n', '\r'}
+    return char in _SPACE_SET
 
 
 def parse_space():
-    return parse_many(parse_sat(is_space))
+    def parser(state):
+        pos, string = state
+        end = _SPACE_RE.match(string, pos).end()
+        return string[pos:end], (end, string)
+    return parser
 
 
 def parse_token(parse_func):
+    skip_space = parse_space()
+
     @wraps(parse_func)
     def parser(state):
         a, state = parse_func(state)
-        parse_space()
+        _, state = skip_space(state)
         return a, state
     return parser
 
@@ -0,0 +1,122 @@
+import unittest
+
+from constant import (
+    Fraction, _SMALL_FRACTIONS, Identifier, Keywords,
+    IntegerConstant, CharConstant, StringConstant,
+)
+from parser import TokenError
+
+
+def terms(fraction):
+    return fraction.numerator, fraction.denominator
+
+
+class FractionTest(unittest.TestCase):
+
+    def test_normalized(self):
+        self.assertEqual(terms(Fraction(2, 4)), (1, 2))
+        self.assertEqual(terms(Fraction(1, -2)), (-1, 2))
+        self.assertEqual(terms(Fraction(0, -5)), (0, 1))
+        with self.assertRaises(ZeroDivisionError):
+            Fraction(1, 0)
+
+    def test_add_sub(self):
+        self.assertEqual(terms(Fraction(1, 6) + Fraction(1, 3)), (1, 2))
+        self.assertEqual(terms(Fraction(3, 4) - Fraction(1, 4)), (1, 2))
+        self.assertEqual(terms(Fraction(1, 2) - Fraction(3, 4)), (-1, 4))
+        self.assertEqual(terms(Fraction(1, 2) + 1), (3, 2))
+        self.assertEqual(terms(Fraction(2) - 5), (-3, 1))
+
+    def test_mul_div(self):
+        self.assertEqual(terms(Fraction(2, 3) * Fraction(9, 4)), (3, 2))
+        self.assertEqual(terms(Fraction(2, 3) * -3), (-2, 1))
+        self.assertEqual(terms(Fraction(2, 3) / Fraction(-4, 9)), (-3, 2))
+        self.assertEqual(terms(Fraction(-1, 2) / -2), (1, 4))
+        with self.assertRaises(ZeroDivisionError):
+            Fraction(1, 2) / 0
+
+    def test_zero_results(self):
+        for zero in (Fraction(1, 2) - Fraction(1, 2),
+                     Fraction(-3, 4) + Fraction(3, 4),
+                     Fraction(0) * Fraction(5, 7),
+                     Fraction(5, 7) * 0,
+                     Fraction(0) / Fraction(-5, 7)):
+            self.assertEqual(terms(zero), (0, 1))
+            self.assertEqual(zero, 0)
+
+    def test_small_integers_are_shared(self):
+        self.assertIs(Fraction.from_int(3), _SMALL_FRACTIONS[3])
+        self.assertIs(Fraction(1, 2) - Fraction(1, 2), _SMALL_FRACTIONS[0])
+        self.assertEqual(terms(Fraction.from_int(-128)), (-128, 1))
+        self.assertEqual(terms(Fraction.from_int(10 ** 20)), (10 ** 20, 1))
+
+    def test_compare(self):
+        self.assertEqual(Fraction(2, 4), Fraction(1, 2))
+        self.assertEqual(Fraction(6, 3), 2)
+        self.assertNotEqual(Fraction(1, 2), Fraction(1, 3))
+        self.assertLess(Fraction(1, 3), Fraction(1, 2))
+        self.assertLess(Fraction(-1, 2), 0)
+        self.assertLessEqual(Fraction(3), 3)
+        self.assertLessEqual(Fraction(1, 4), Fraction(2, 4))
+        self.assertFalse(Fraction(1) == 'a')
+        with self.assertRaises(TypeError):
+            Fraction(1) < 'a'
+
+    def test_hash(self):
+        self.assertEqual(hash(Fraction(3)), hash(3))
+        self.assertEqual(hash(Fraction(2, 4)), hash(Fraction(1, 2)))
+        self.assertEqual({Fraction(3): 'x'}[3], 'x')
+        self.assertNotIn(Fraction(1), {1.0})
+
+
+class LexerTest(unittest.TestCase):
+
+    def test_identifier_at_position(self):
+        identifier, state = Identifier.parse_identifier((4, 'int foo_1[3]'))
+        self.assertEqual(identifier.name, 'foo_1')
+        self.assertEqual(state, (9, 'int foo_1[3]'))
+        with self.assertRaises(TokenError):
+            Identifier.parse_identifier((0, '[abc'))
+        with self.assertRaises(TokenError):
+            Identifier.parse_identifier((0, '^abc'))
+
+    def test_longest_keyword(self):
+        self.assertEqual(Keywords.parse_keyword((0, 'double x')), (Keywords.DOUBLE, (6, 'double x')))
+        self.assertEqual(Keywords.parse_keyword((0, 'do {')), (Keywords.DO, (2, 'do {')))
+        self.assertEqual(Keywords.parse_keyword((2, '{ int')), (Keywords.INT, (5, '{ int')))
+        with self.assertRaises(TokenError):
+            Keywords.parse_keyword((0, 'x'))
+
+    def test_integer_literals(self):
+        constant, state = IntegerConstant.parse((2, 'a 123;'))
+        self.assertEqual((constant.value, state), (123, (5, 'a 123;')))
+        constant, state = IntegerConstant.parse((0, '0x1F'))
+        self.assertEqual((constant.value, state), (31, (4, '0x1F')))
+        constant, state = IntegerConstant.parse((0, '017'))
+        self.assertEqual((constant.value, state), (15, (3, '017')))
+
+    def test_char_literals(self):
+        for source, char in [("'a'", b'a'), (r"'\n'", b'\n'), (r"'\''", b"'"),
+                             (r"'\x41'", b'A'), (r"'\101'", b'A')]:
+            constant, state = CharConstant.parse((0, source))
+            self.assertEqual((constant.value, state), (char, (len(source), source)))
+
+    def test_string_escapes(self):
+        source = r'"a\nb\t\\\"q\x41\101\0z" x'
+        constant, state = StringConstant.parse((0, source))
+        self.assertEqual(constant.value, 'a\nb\t\\"qAA\0z')
+        self.assertEqual(state, (len(source) - 2, source))
+        constant, _ = StringConstant.parse((0, '"héllo"'))
+        self.assertEqual(constant.value, 'héllo')
+
+    def test_string_errors(self):
+        with self.assertRaises(TokenError):
+            StringConstant.parse((0, r'"\xZZ"'))
+        with self.assertRaises(TokenError):
+            StringConstant.parse((0, r'"\9"'))
+        with self.assertRaises(TokenError):
+            StringConstant.parse((0, '"abc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
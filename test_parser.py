@@ -0,0 +1,56 @@
+import unittest
+
+from parser import (
+    TokenError, parse_item, parse_sat, parse_char, parse_string,
+    parse_many, parse_many1, parse_space, parse_symbol,
+)
+
+
+class ParserTest(unittest.TestCase):
+
+    def assertTokenError(self, parser, state, pos):
+        with self.assertRaises(TokenError) as context:
+            parser(state)
+        self.assertEqual(context.exception.pos, pos)
+
+    def test_item(self):
+        self.assertEqual(parse_item((1, 'ab')), ('b', (2, 'ab')))
+        self.assertTokenError(parse_item, (2, 'ab'), 2)
+
+    def test_error_positions(self):
+        digit = parse_sat(str.isdigit)
+        self.assertEqual(digit((0, '1a')), ('1', (1, '1a')))
+        self.assertTokenError(digit, (1, '1a'), 2)  # after the bad character
+        self.assertTokenError(digit, (2, '1a'), 2)  # EOF
+        self.assertEqual(parse_char('a')((0, 'ab')), ('a', (1, 'ab')))
+        self.assertTokenError(parse_char('a'), (1, 'ab'), 2)
+        self.assertTokenError(parse_char('a'), (2, 'ab'), 2)
+
+    def test_string(self):
+        self.assertEqual(parse_string('int')((0, 'int x')), ('int', (3, 'int x')))
+        self.assertTokenError(parse_string('int'), (0, 'inx'), 3)
+
+    def test_many(self):
+        many = parse_many(parse_char('a'))
+        self.assertEqual(many((0, '')), ([], (0, '')))
+        self.assertEqual(many((0, 'b')), ([], (0, 'b')))
+        self.assertEqual(many((0, 'aab')), (['a', 'a'], (2, 'aab')))
+
+    def test_many1(self):
+        many1 = parse_many1(parse_char('a'))
+        self.assertEqual(many1((0, 'ab')), (['a'], (1, 'ab')))
+        self.assertEqual(many1((0, 'aaa')), (['a', 'a', 'a'], (3, 'aaa')))
+        self.assertTokenError(many1, (0, ''), 0)
+        self.assertTokenError(many1, (0, 'b'), 1)
+
+    def test_space(self):
+        self.assertEqual(parse_space()((1, 'a \t\n x')), (' \t\n ', (5, 'a \t\n x')))
+        self.assertEqual(parse_space()((0, 'x')), ('', (0, 'x')))
+
+    def test_symbol_skips_space(self):
+        self.assertEqual(parse_symbol('int')((0, 'int   x')), ('int', (6, 'int   x')))
+        self.assertEqual(parse_symbol('int')((0, 'int')), ('int', (3, 'int')))
+
+
+if __name__ == '__main__':
+    unittest.main()
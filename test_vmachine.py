@@ -0,0 +1,189 @@
+import unittest
+
+from vmachine import VirtualMachine
+
+
+def load(vm, instructions):
+    for inst in instructions:
+        vm.add_instruction(inst)
+    vm.IP = vm.CS
+
+
+class FlagsTest(unittest.TestCase):
+
+    def test_flags_are_cleared(self):
+        vm = VirtualMachine()
+        load(vm, [
+            vm.move('AX', '1'),
+            vm.sub('AX', '2'),  # -1
+            vm.add('AX', '1'),  # 0
+            vm.add('AX', '1'),  # 1
+        ])
+        vm.next()
+        vm.next()
+        self.assertEqual((vm.AX, vm.ZERO, vm.NEG), (-1, 0, 1))
+        vm.next()
+        self.assertEqual((vm.AX, vm.ZERO, vm.NEG), (0, 1, 0))
+        vm.next()
+        self.assertEqual((vm.AX, vm.ZERO, vm.NEG), (1, 0, 0))
+
+    def test_sub_and_bit_and_store_numbers(self):
+        vm = VirtualMachine()
+        load(vm, [
+            vm.move('AX', '7'),
+            vm.sub('AX', '3'),
+            vm.move('BX', '6'),
+            vm.bit_and('BX', '3'),
+        ])
+        vm.run(4)
+        self.assertEqual((vm.AX, vm.BX), (4, 2))
+
+    def test_loop_with_conditional_jump(self):
+        vm = VirtualMachine()
+        load(vm, [
+            vm.move('AX', '10'),
+            vm.move('BX', '0'),
+            vm.add('BX', 'AX'),  # 2: loop body
+            vm.sub('AX', '1'),
+            vm.jne('2'),
+        ])
+        vm.run(5)
+        self.assertEqual((vm.AX, vm.BX), (0, 55))
+
+
+class OperandTest(unittest.TestCase):
+
+    def test_immediate_destination_is_rejected_when_built(self):
+        vm = VirtualMachine()
+        for build in (lambda: vm.move('1', 'AX'),
+                      lambda: vm.add('2', 'AX'),
+                      lambda: vm.pop(writable='3')):
+            with self.assertRaisesRegex(TypeError, r'^Unknown type: \d$'):
+                build()
+        vm.cmp('1', 'AX')  # not written
+        vm.pop(None)
+
+    def test_write_to_immediate(self):
+        vm = VirtualMachine()
+        with self.assertRaisesRegex(TypeError, '^Unknown type: 1$'):
+            vm.write_address('1', 5)
+
+    def test_memory_operands(self):
+        vm = VirtualMachine()
+        vm.BP = 10
+        vm.write_address('[BP - 4]', 7)
+        vm.write_address('[BP+1]', 8)
+        vm.write_address('[3]', 9)
+        self.assertEqual(vm.data[5:12], [0, 7, 0, 0, 0, 0, 8])
+        self.assertEqual(vm.read_address('[ BP + 1 ]'), 8)
+        self.assertEqual(vm.read_address('[3]'), 9)
+        self.assertEqual(vm.read_address('[BP-4]', address_only=True), 6)
+
+
+class FuseTest(unittest.TestCase):
+
+    @staticmethod
+    def program(vm):
+        # sum 1..10 into BX, then return through the stack to 11
+        load(vm, [
+            vm.move('AX', '10'),
+            vm.move('BX', '0'),
+            vm.push('11'),  # return address
+            vm.jmp('6'),
+            vm.move('CX', '1'),  # 4: skipped
+            vm.move('DX', '1'),  # 5: skipped
+            vm.add('BX', 'AX'),  # 6: the loop jumps into the middle of this block
+            vm.sub('AX', '1'),
+            vm.jne('6'),
+            vm.ret(),
+            vm.move('CX', '2'),  # 10: skipped
+            vm.move('DX', 'BX'),  # 11
+        ])
+
+    def run_program(self, finalize, step):
+        vm = VirtualMachine()
+        self.program(vm)
+        if finalize:
+            vm.finalize_code()
+            vm.IP = vm.CS
+        if step:
+            while vm.IP != 12:
+                vm.next()
+        else:
+            vm.run(12)
+        return vm.AX, vm.BX, vm.CX, vm.DX, vm.SP
+
+    def test_same_result_with_and_without_fusion(self):
+        expected = (0, 55, 0, 55, 2 * 10000)
+        for finalize in (False, True):
+            for step in (False, True):
+                with self.subTest(finalize=finalize, step=step):
+                    self.assertEqual(self.run_program(finalize, step), expected)
+
+    def test_stop_inside_block(self):
+        vm = VirtualMachine()
+        load(vm, [vm.add('AX', '1')] * 5)
+        vm.finalize_code(stops=[3])
+        vm.IP = vm.CS
+        vm.run(3)
+        self.assertEqual((vm.AX, vm.IP), (3, 3))
+        vm.run(5)
+        self.assertEqual((vm.AX, vm.IP), (5, 5))
+
+    def test_push_jmp_ret_round_trip(self):
+        vm = VirtualMachine()
+        load(vm, [
+            vm.push('3'),
+            vm.jmp('4'),
+            vm.move('AX', '1'),  # 2: skipped
+            vm.move('BX', '2'),  # 3: returned to
+            vm.ret(),  # 4
+        ])
+        vm.next()
+        vm.next()
+        self.assertEqual(vm.IP, 4)
+        vm.next()
+        self.assertEqual(vm.IP, 3)
+        vm.next()
+        self.assertEqual((vm.AX, vm.BX), (0, 2))
+
+    def test_error_inside_fused_block(self):
+        for step in (False, True):
+            with self.subTest(step=step):
+                vm = VirtualMachine()
+                load(vm, [
+                    vm.move('AX', '1'),
+                    vm.div('AX', '0'),
+                    vm.move('BX', '1'),
+                    vm.jmp('0'),
+                ])
+                vm.finalize_code()
+                vm.IP = vm.CS
+                with self.assertRaises(ZeroDivisionError):
+                    if step:
+                        vm.next()
+                    else:
+                        vm.run(4)
+                self.assertEqual(vm.IP, 2)  # just past the failing instruction
+                self.assertEqual(vm.BX, 0)
+
+    def test_error_in_fused_branch(self):
+        for step in (False, True):
+            with self.subTest(step=step):
+                vm = VirtualMachine()
+                load(vm, [
+                    vm.move('AX', '1'),
+                    vm.jmp('[BP+5]'),  # past the end of the stack
+                ])
+                vm.finalize_code()
+                vm.IP = vm.CS
+                with self.assertRaises(IndexError):
+                    if step:
+                        vm.next()
+                    else:
+                        vm.run(2)
+                self.assertEqual(vm.IP, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
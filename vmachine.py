@@ -1,11 +1,49 @@
-from io import BytesIO
-from functools import wraps
+import inspect
+import operator
+import re
+from io import BytesIO, BufferedReader, RawIOBase
+from functools import partial, wraps
+from itertools import islice
 
 
 def unavailable(err_type, *args, **kwargs):
     raise err_type(*args, **kwargs)
 
 
+REGISTERS = ('AX', 'BX', 'CX', 'DX', 'SP', 'BP')
+_REGS = frozenset(REGISTERS)
+_REG_GET = {register: operator.attrgetter(register) for register in REGISTERS}
+_MEM_RE = re.compile(r'\s*(%s)(?:\s*([+-])\s*(\d+))?\s*$' % '|'.join(REGISTERS))  # BP-4, BP - 4
+
+# operand kinds
+REGISTER = 0  # AX
+MEMORY = 1  # [BP-4]
+ABSOLUTE = 2  # [100]
+IMMEDIATE = 3  # 42 or 4.2
+
+
+def compile_operand(target):
+    """
+    Parse an operand string once into `(kind, register, value)`,
+    where `value` is the offset for MEMORY, the address for ABSOLUTE
+    and the number itself for IMMEDIATE
+    """
+    if target in _REGS:  # AX
+        return REGISTER, target, None
+    elif target.startswith('[') and target.endswith(']'):  # memory
+        address = target[1:-1]
+        result = _MEM_RE.match(address)
+        if result is None:
+            return ABSOLUTE, None, int(address)
+        register, sign, offset = result.groups()
+        offset = int(offset) if offset else 0
+        return MEMORY, register, -offset if sign == '-' else offset
+    else:  # immediate number
+        if '.' in target:
+            return IMMEDIATE, None, float(target)
+        return IMMEDIATE, None, int(target)
+
+
 def instruction(func):
     """
     Calling the `instruction` decorated method of VM
@@ -29,32 +67,80 @@ def instruction(func):
         :param kwargs:
         :return:
         """
+        # identical instructions share one closure
+        key = (func, args, tuple(sorted(kwargs.items())))
+        calling = self._inst_cache.get(key)
+        if calling is not None:
+            return calling
+
+        # a destination must be writable, which is known before execution
+        writes = getattr(func, 'writes', None)
+        if writes is not None:
+            index, name = writes
+            target = args[index] if index < len(args) else kwargs.get(name)
+            if isinstance(target, str) and compile_operand(target)[0] == IMMEDIATE:
+                raise TypeError("Unknown type: %s" % target)
+
+        # operands are parsed here rather than on every execution
+        args = tuple(compile_operand(arg) if isinstance(arg, str) else arg for arg in args)
+        kwargs = {name: compile_operand(arg) if isinstance(arg, str) else arg for name, arg in kwargs.items()}
+
         # here self, *args, **kwargs will be passed to func
         @wraps(func)
         def calling():
             return func(self, *args, **kwargs)
+        calling.branch = getattr(func, 'branch', False)
+        self._inst_cache[key] = calling
         return calling
     return instruction_constructor
 
 
+def branch(func):
+    """
+    Mark an instruction which may change IP, so that
+    `finalize_code` ends a basic block after it
+    """
+    func.branch = True
+    return func
+
+
+def writes(name):
+    """
+    Mark the operand `name` of an instruction as its destination,
+    so that an immediate number there is rejected when it is built
+    """
+    def decorator(func):
+        index = list(inspect.signature(func).parameters).index(name) - 1  # without self
+        func.writes = (index, name)
+        return func
+    return decorator
+
+
 class VirtualMachine:
+    # fixed layout, like the fields of a C struct
+    __slots__ = (
+        'code', 'jumps', 'data', 'CS', 'DS', 'SS', 'IP',
+        'AX', 'BX', 'CX', 'DX', 'SP', 'BP', 'ZERO', 'NEG',
+        '_inst_cache', '_input_stream', '_input_read', 'output_stream',
+    )
 
     def __init__(self, memory_size=10000, input_stream=None, output_stream=None):
-        self.memory = [
-                          lambda: unavailable(TypeError, 'Empty')
-                      ] * memory_size  # which will invoke error when called
+        # code and data are kept apart so the data segment holds numbers only
+        self.code = [
+                        lambda: unavailable(TypeError, 'Empty')
+                    ] * memory_size  # which will invoke error when called
+        self.jumps = [True] * memory_size  # whether code[i] may read or change IP
         self.CS = 0
 
-        self.DS = len(self.memory)
-        self.memory += [0] * memory_size  # add data segment
-
-        self.SS = len(self.memory)
-        self.memory += [0] * memory_size  # add stack
+        self.data = [0] * (2 * memory_size)  # data segment followed by stack
+        self.DS = 0
+        self.SS = memory_size
         # point stack pointer to stack end
-        self.SP = len(self.memory)
-        self.BP = len(self.memory) - 1
+        self.SP = len(self.data)
+        self.BP = len(self.data) - 1
 
         self.IP = self.CS
+        self._inst_cache = {}  # see `instruction`
         self.AX = 0
         self.BX = 0
         self.CX = 0
@@ -73,73 +159,161 @@ class VirtualMachine:
         else:
             self.output_stream = output_stream
 
+    @property
+    def input_stream(self):
+        return self._input_stream
+
+    @input_stream.setter
+    def input_stream(self, stream):
+        if isinstance(stream, RawIOBase):  # avoid a system call per character
+            stream = BufferedReader(stream, buffer_size=65536)
+        self._input_stream = stream
+        self._input_read = partial(stream.read, 1)  # bytes or str, both work with ord
+
     def add_instruction(self, inst):
-        self.memory[self.IP] = inst
+        self.code[self.IP] = inst
+        self.jumps[self.IP] = getattr(inst, 'branch', None) is not False
         self.IP += 1
 
     def next(self):
-        inst: callable = self.memory[self.IP]  # read instruction
+        inst: callable = self.code[self.IP]  # read instruction
         self.IP += 1  # move to next
         return inst()
 
+    def run(self, until=None):
+        """
+        Execute instructions like repeated `next` until IP reaches `until`,
+        keeping IP in a local variable. It is only written back around
+        instructions which may change it (branches, fused blocks and
+        anything else not built by `instruction`), as recorded in `jumps`.
+        """
+        code = self.code
+        jumps = self.jumps
+        ip = self.IP
+        try:
+            while ip != until:
+                inst = code[ip]  # read instruction
+                jump = jumps[ip]
+                ip += 1  # move to next
+                if jump:
+                    self.IP = ip
+                    try:
+                        inst()
+                    finally:  # also keep what it set if it raises
+                        ip = self.IP
+                else:  # leaves IP alone
+                    inst()
+        finally:
+            self.IP = ip
+
+    def fuse(self, block, offset, start):
+        """
+        Run `block[offset:]` as one instruction, where `block` is a basic
+        block stored at `start`. IP ends up after the block unless its
+        last instruction jumps elsewhere, or after the failing instruction
+        like `next` does.
+        """
+        tail = block[-1] if block[-1].branch else None
+        body_end = len(block) - 1 if tail is not None else len(block)
+        end = start + len(block)
+
+        def calling():
+            ip = start + offset
+            result = None
+            try:
+                for inst in islice(block, offset, body_end):
+                    ip += 1
+                    result = inst()
+            finally:
+                self.IP = ip
+            if tail is not None:
+                self.IP = end
+                result = tail()
+            return result
+        return calling
+
+    def finalize_code(self, start=None, end=None, stops=()):
+        """
+        Fuse each straight-line run of instructions (a basic block, ending
+        with at most one branch) so that `next` dispatches it at once.
+        Every slot of a block runs the rest of that block, so jumping
+        into the middle of it still works.
+
+        A fused block always runs to its end, so IP never stops inside it:
+        `run(until)` or stepping with `next` until some address only stops
+        there if the address starts a block. Pass such addresses in `stops`
+        to start a new block at each of them.
+
+        Call it once all instructions have been added: fused slots keep
+        the instructions they were built from, so changing the code
+        afterwards (e.g. with `add_instruction`) is not seen by them.
+        """
+        start = self.CS if start is None else start
+        end = len(self.code) if end is None else end
+        stops = frozenset(stops)
+        block_start = start
+        for ip in range(start, end):
+            if ip in stops and ip > block_start:  # split before a stop address
+                self.fuse_block(block_start, ip)
+                block_start = ip
+            is_branch = getattr(self.code[ip], 'branch', None)
+            if is_branch is False:  # plain instruction
+                continue
+            # a branch closes the block, anything else (empty or fused) only bounds it
+            block_end = ip + 1 if is_branch else ip
+            self.fuse_block(block_start, block_end)
+            block_start = ip + 1
+        self.fuse_block(block_start, end)
+
+    def fuse_block(self, start, end):
+        block = tuple(self.code[start:end])
+        for offset in range(len(block) - 1):  # the last slot stays as it is
+            self.code[start + offset] = self.fuse(block, offset, start)
+            self.jumps[start + offset] = True
+
     def read_address(self, target, address_only=False):
-        if target in ['AX', 'BX', 'CX', 'DX', 'SP', 'BP']:  # AX
+        if isinstance(target, str):
+            target = compile_operand(target)
+        kind, register, value = target
+        if kind == REGISTER:
             if address_only:
                 raise TypeError('NO ADDRESS')
-            return getattr(self, target)
-        elif target.startswith('[') and target.endswith(']'):  # memory
-            address = target[1:-1]
-            for register in ['AX', 'BX', 'CX', 'DX', 'SP', 'BP']:
-                if address.startswith(register):
-                    if '+' in address:
-                        offset = int(address.split('+')[1])
-                    elif '-' in address:
-                        offset = -int(address.split('-')[1])
-                    else:
-                        offset = 0
-                    address = getattr(self, register) + offset
-                    break
-            else:
-                address = int(address)
-            if address_only:
-                return address
-            return self.memory[address]
+            return _REG_GET[register](self)
+        elif kind == MEMORY:
+            address = _REG_GET[register](self) + value
+        elif kind == ABSOLUTE:
+            address = value
         else:  # immediate number
             if address_only:
                 raise TypeError('NO ADDRESS')
-            if '.' in target:
-                return float(target)
-            return int(target)
+            return value
+        if address_only:
+            return address
+        return self.data[address]
 
     def write_address(self, target, value):
-        if target in ['AX', 'BX', 'CX', 'DX', 'SP', 'BP']:  # AX
-            setattr(self, target, value)
-        elif target.startswith('[') and target.endswith(']'):  # memory
-            address = target[1:-1]
-            for register in ['AX', 'BX', 'CX', 'DX', 'SP', 'BP']:
-                if address.startswith(register):
-                    if '+' in address:
-                        offset = int(address.split('+')[1])
-                    elif '-' in address:
-                        offset = -int(address.split('-')[1])
-                    else:
-                        offset = 0
-                    address = getattr(self, register) + offset
-                    break
-            else:
-                address = int(address)
-            self.memory[address] = value
+        if isinstance(target, str):
+            target = compile_operand(target)
+        kind, register, operand = target
+        if kind == REGISTER:
+            setattr(self, register, value)
+        elif kind == MEMORY:
+            self.data[_REG_GET[register](self) + operand] = value
+        elif kind == ABSOLUTE:
+            self.data[operand] = value
         else:
-            raise TypeError("Unknown type: %s" % target)
+            raise TypeError("Unknown type: %s" % operand)
 
     # memory operations
     @instruction
+    @writes('destination')
     def move(self, destination, source):
         # parse origin
         source = self.read_address(source)
         self.write_address(destination, source)
 
     @instruction
+    @writes('destination')
     def lea(self, destination, variable):
         variable = self.read_address(variable, address_only=True)
         self.write_address(destination, variable)
@@ -150,11 +324,12 @@ class VirtualMachine:
         if self.SP == self.SS:
             raise MemoryError('Insufficient stack space')
         target = self.read_address(target)
-        self.memory[self.SP] = target
+        self.data[self.SP] = target
 
     @instruction
+    @writes('writable')
     def pop(self, writable):
-        value = self.memory[self.SP]
+        value = self.data[self.SP]
         self.SP += 1
         if writable is not None:  # for inner calling
             self.write_address(writable, value)
@@ -162,8 +337,11 @@ class VirtualMachine:
 
     # IO operations
     @instruction
+    @writes('writable')
     def input(self, writable):
-        value = self.input_stream.read(1)
+        value = self._input_read()
+        if not value:
+            raise EOFError('No more input')
         value = ord(value)  # write ascii code
         self.write_address(writable, value)
 
@@ -174,19 +352,22 @@ class VirtualMachine:
 
     # arithmetic operations
     def set_flags(self, value):
-        if value == 0:
-            self.ZERO = 1
-        if value < 0:
-            self.NEG = 1
+        self.ZERO = int(value == 0)
+        self.NEG = int(value < 0)
+
+    def alu(self, op, x, y):
+        """
+        Apply the binary `op` to `x` and `y`, set flags and store into `x`
+        """
+        result = op(self.read_address(x), self.read_address(y))
+        self.set_flags(result)
+        self.write_address(x, result)
+        return result
 
     @instruction
+    @writes('x')
     def add(self, x, y):
-        value1 = self.read_address(x)
-        value2 = self.read_address(y)
-        total = value1 + value2
-        self.set_flags(total)
-        self.write_address(x, total)
-        return total
+        return self.alu(operator.add, x, y)
 
     @instruction
     def cmp(self, x, y):
@@ -197,37 +378,28 @@ class VirtualMachine:
         return diff
 
     @instruction
+    @writes('x')
     def sub(self, x, y):
-        diff = self.cmp(x, y)
-        self.write_address(x, diff)
-        return diff
+        return self.alu(operator.sub, x, y)
 
     @instruction
+    @writes('x')
     def mul(self, x, y):
-        value1 = self.read_address(x)
-        value2 = self.read_address(y)
-        prod = value1 * value2
-        self.set_flags(prod)
-        self.write_address(x, prod)
+        return self.alu(operator.mul, x, y)
 
     @instruction
+    @writes('x')
     def div(self, x, y):
-        value1 = self.read_address(x)
-        value2 = self.read_address(y)
-        quot = value1 // value2
-        self.set_flags(quot)
-        self.write_address(x, quot)
+        return self.alu(operator.floordiv, x, y)
 
     @instruction
+    @writes('x')
     def fdiv(self, x, y):
-        value1 = self.read_address(x)
-        value2 = self.read_address(y)
-        quot = value1 / value2
-        self.set_flags(quot)
-        self.write_address(x, quot)
+        return self.alu(operator.truediv, x, y)
 
     # bitwise operations
     @instruction
+    @writes('x')
     def bit_not(self, x):
         value = self.read_address(x)
         result = ~value
@@ -243,33 +415,29 @@ class VirtualMachine:
         return result
 
     @instruction
+    @writes('x')
     def bit_and(self, x, y):
-        result = self.bit_test(x, y)
-        self.write_address(x, result)
+        return self.alu(operator.and_, x, y)
 
     @instruction
+    @writes('x')
     def bit_or(self, x, y):
-        value1 = self.read_address(x)
-        value2 = self.read_address(y)
-        result = value1 | value2
-        self.set_flags(result)
-        self.write_address(x, result)
+        return self.alu(operator.or_, x, y)
 
     @instruction
+    @writes('x')
     def bit_xor(self, x, y):
-        value1 = self.read_address(x)
-        value2 = self.read_address(y)
-        result = value1 ^ value2
-        self.set_flags(result)
-        self.write_address(x, result)
+        return self.alu(operator.xor, x, y)
 
     # jump operations
     @instruction
+    @branch
     def jmp(self, address):
         address = self.read_address(address)
         self.IP = address
 
     @instruction
+    @branch
     def je(self, address):
         address = self.read_address(address)
         if self.ZERO:
@@ -278,6 +446,7 @@ class VirtualMachine:
     jz = je
 
     @instruction
+    @branch
     def jne(self, address):
         address = self.read_address(address)
         if not self.ZERO:
@@ -286,42 +455,49 @@ class VirtualMachine:
     jnz = jne
 
     @instruction
+    @branch
     def jb(self, address):  # jump if below
         address = self.read_address(address)
         if not self.ZERO and self.NEG:  # result of CMP x, y
             self.IP = address
 
     @instruction
+    @branch
     def jnb(self, address):
         address = self.read_address(address)
         if self.ZERO or not self.NEG:
             self.IP = address
 
     @instruction
+    @branch
     def jbe(self, address):
         address = self.read_address(address)
         if self.ZERO or self.NEG:
             self.IP = address
 
     @instruction
+    @branch
     def ja(self, address):  # jump if above
         address = self.read_address(address)
         if not self.ZERO and not self.NEG:
             self.IP = address
 
     @instruction
+    @branch
     def jna(self, address):
         address = self.read_address(address)
         if self.ZERO or self.NEG:
             self.IP = address
 
     @instruction
+    @branch
     def jae(self, address):
         address = self.read_address(address)
         if self.ZERO or not self.NEG:
             self.IP = address
 
     @instruction
+    @branch
     def ret(self):
-        address = self.pop(None)
-        self.jmp(str(address))
+        address = self.pop(None)()
+        self.jmp(str(address))()